@@ -0,0 +1,350 @@
+"""
+Static estimation of the cost of evaluating expressions.
+"""
+
+from collections import ChainMap, namedtuple
+from functools import wraps
+from .vals import LispSymbol, LispList, LispFunc, LispBuiltin
+from .built_ins import default_globals
+from .errs import LimitationError
+
+UNBOUNDED = float('inf')
+
+class Estimate(namedtuple('Estimate', 'steps depth things')):
+    """Upper bounds on the resources used by an evaluation.
+
+    Any of the bounds may be :data:`UNBOUNDED`.
+
+    Attributes:
+        steps (int): The number of steps that may be taken.
+        depth (int): The level of nesting that may be reached.
+        things (int): The number of values that may be allocated.
+    """
+
+    __slots__ = ()
+
+    def then(self, other):
+        """Estimate doing something and then something else."""
+        return Estimate(self.steps + other.steps,
+                        max(self.depth, other.depth),
+                        self.things + other.things)
+
+    def either(self, other):
+        """Estimate doing either something or something else."""
+        return Estimate(*map(max, self, other))
+
+    def nested(self):
+        """Estimate doing something inside of one more step."""
+        return Estimate(self.steps + 1, self.depth + 1, self.things)
+
+    @property
+    def bounded(self):
+        return UNBOUNDED not in self
+
+FREE = Estimate(0, 0, 0)
+
+default_costs = {}
+
+def cost_of(d, name, count_args=True, globals=default_globals):
+    """Register a cost function for a built-in.
+
+    A cost function is called as ``f(analyzer, scope, *args)`` (or
+    ``f(analyzer, scope, args)`` if ``count_args`` is false). Each argument is
+    either an unevaluated argument expression (if the built-in quotes its
+    arguments) or what is statically known about an evaluated argument. It
+    must return an :class:`Estimate` of the cost of the call, not including
+    the cost of evaluating the arguments, along with what is statically known
+    about the result.
+
+    Statically known values are :class:`~parthial.vals.LispVal` instances, or
+    ``None`` for values that are not known until evaluation.
+
+    Args:
+        d (dict): The dict to register the cost function in.
+        name (str): The name of the built-in.
+        count_args (bool, optional): Whether to assume that calls with the
+            wrong number of arguments fail immediately, as they would for
+            built-ins with ``count_args``.
+        globals (dict-like, optional): The scope to look up the built-in in.
+    """
+    def _(f):
+        if count_args:
+            arg_count = f.__code__.co_argcount - 2
+            @wraps(f)
+            def wrapped(analyzer, scope, args):
+                if len(args) == arg_count:
+                    return f(analyzer, scope, *args)
+                else:
+                    return FREE, None
+        else:
+            wrapped = f
+        d[globals[name]] = wrapped
+        return wrapped
+    return _
+
+class Analyzer:
+    """An estimator of the cost of evaluating expressions without evaluating
+    them.
+
+    Calls to :class:`~parthial.vals.LispFunc` instances are estimated by
+    estimating their bodies, so code that does not recurse gets finite bounds.
+    Each body is only estimated once for each combination of statically known
+    arguments, until a variable is assigned to.
+    Recursion (through functions, ``eval`` or ``apply``), calls to values that
+    cannot be known statically, and calls to built-ins without a cost function
+    all get :data:`UNBOUNDED` bounds.
+
+    Estimates are meant for rejecting expressions early, and are not a
+    replacement for the limits enforced by
+    :class:`~parthial.context.Context`; variables that are reassigned while
+    evaluating may make them inaccurate.
+
+    Attributes:
+        problems (list of str): The reasons that the last estimate was
+            :data:`UNBOUNDED`.
+
+    Args:
+        env (Environment): The :class:`~parthial.context.Environment` that
+            expressions would be evaluated in. It will not be modified.
+        costs (dict, optional): Cost functions for built-ins, as registered
+            with :func:`cost_of`. Defaults to :data:`default_costs`.
+        max_depth (int, optional): The level of nesting after which analysis
+            stops.
+        max_visits (int, optional): The number of subexpressions that may be
+            analyzed before analysis stops.
+    """
+
+    def __init__(self, env, costs=None, max_depth=None, max_visits=100000):
+        self.env = env
+        self.costs = default_costs if costs is None else costs
+        self.max_depth, self.max_visits = max_depth, max_visits
+        self.problems = []
+        self.depth = self.visits = self.branching = 0
+        self.active = set()
+        self.memo = {}
+
+    def estimate(self, expr):
+        """Estimate the cost of evaluating an expression.
+
+        Args:
+            expr (LispVal): The expression to estimate.
+
+        Returns:
+            Estimate: The estimate.
+
+        Raises:
+            ~parthial.errs.LimitationError: If the expression nests more than
+                ``max_depth`` levels deep, or is too complex to analyze.
+        """
+        self.problems = []
+        self.depth = self.visits = self.branching = 0
+        self.active.clear()
+        self.memo.clear()
+        est, _ = self.eval(expr, self.env.scopes.new_child())
+        return est
+
+    def unbounded(self, problem):
+        """Give up on estimating something.
+
+        Args:
+            problem (str): The reason for giving up.
+
+        Returns:
+            An :data:`UNBOUNDED` :class:`Estimate` and an unknown value.
+        """
+        self.problems.append(problem)
+        return Estimate(UNBOUNDED, UNBOUNDED, UNBOUNDED), None
+
+    def eval(self, expr, scope):
+        """Estimate the cost of one step of evaluation.
+
+        Args:
+            expr (LispVal): The expression to estimate.
+            scope (ChainMap): The statically known variables. Assignments
+                will be made to its innermost scope.
+
+        Returns:
+            The :class:`Estimate` and the statically known result.
+        """
+        if self.max_depth is not None and self.depth >= self.max_depth:
+            raise LimitationError('too much nesting')
+        if self.visits >= self.max_visits:
+            raise LimitationError('too complex to analyze')
+        self.depth += 1
+        self.visits += 1
+        est, val = self._eval(expr, scope)
+        self.depth -= 1
+        return est.nested(), val
+
+    def eval_once(self, expr, scope, key, problem, val):
+        """:meth:`eval`, unless ``key`` is already being evaluated.
+
+        Args:
+            expr (LispVal): The expression to estimate.
+            scope (ChainMap): The statically known variables.
+            key: What identifies the evaluation for the purposes of detecting
+                recursion.
+            problem (str): A template for the reason to give if it is
+                recursive.
+            val: The value to fill the template in with.
+        """
+        if key in self.active:
+            return self.unbounded(problem.format(val))
+        self.active.add(key)
+        try:
+            return self.eval(expr, scope)
+        finally:
+            self.active.discard(key)
+
+    def call(self, f, args, scope):
+        """Estimate the cost of a call.
+
+        Args:
+            f (LispVal): The callable.
+            args (list): The arguments, as they would be passed to ``f``.
+            scope (ChainMap): The statically known variables of the caller.
+
+        Returns:
+            The :class:`Estimate` and the statically known result.
+        """
+        if isinstance(f, LispFunc):
+            if len(args) != len(f.pars):
+                return FREE, None
+            # estimating with only the functions known is less precise, but
+            # can be shared between many more calls
+            start = len(self.problems)
+            fs = [a if isinstance(a, (LispFunc, LispBuiltin)) else None
+                  for a in args]
+            res = self.call_body(f, fs)
+            if not res[0].bounded and fs != args:
+                precise = self.call_body(f, args)
+                if precise[0].bounded:
+                    del self.problems[start:]
+                    res = precise
+            return res
+        cost = self.costs.get(f)
+        if cost is None:
+            return self.unbounded('call to unknown built-in {}'.format(f))
+        if f.quotes and None in args:
+            return self.unbounded('call to {} with unknown code'.format(f))
+        return cost(self, scope, args)
+
+    def call_body(self, f, args):
+        key = (f.body, tuple(map(id, f.clos.maps)), tuple(args),
+               bool(self.branching))
+        if key in self.memo:
+            res, problems, _ = self.memo[key]
+            self.problems.extend(problems)
+            return res
+        start = len(self.problems)
+        arg_scope = dict(zip(f.pars, args))
+        res = self.eval_once(f.body, ChainMap(arg_scope, *f.clos.maps),
+                             f.body, 'recursive call to {}', f)
+        # keep f alive, so that the ids of its scopes aren't reused
+        self.memo[key] = res, self.problems[start:], f
+        return res
+
+    def lookup(self, k, scope):
+        if k in scope:
+            return scope[k]
+        return self.env.globals.get(k)
+
+    def _eval(self, expr, scope):
+        if isinstance(expr, LispSymbol):
+            return FREE, self.lookup(expr.val, scope)
+        elif isinstance(expr, LispList) and expr:
+            est, f = self.eval(expr.val[0], scope)
+            if f is None:
+                est2, val = self.unbounded('call to unknown function')
+                return est.then(est2), val
+            if not isinstance(f, (LispFunc, LispBuiltin)):
+                return est, None
+            args = expr.val[1:]
+            if not f.quotes:
+                vals = []
+                for arg in args:
+                    arg_est, val = self.eval(arg, scope)
+                    est = est.then(arg_est)
+                    vals.append(val)
+                args = vals
+            call_est, val = self.call(f, args, scope)
+            return est.then(call_est), val
+        else:
+            return FREE, expr
+
+@cost_of(default_costs, 'eval')
+def eval_cost(analyzer, scope, code):
+    if code is None:
+        return analyzer.unbounded('eval of unknown code')
+    return analyzer.eval_once(code, scope, code, 'recursive eval of {}', code)
+
+@cost_of(default_costs, 'apply')
+def apply_cost(analyzer, scope, f, xs):
+    if f is None:
+        return analyzer.unbounded('apply of unknown function')
+    if not isinstance(f, (LispFunc, LispBuiltin)):
+        return FREE, None
+    if xs is None:
+        if not isinstance(f, LispFunc):
+            return analyzer.unbounded('apply with unknown arguments')
+        args = [None] * len(f.pars)
+    elif isinstance(xs, LispList):
+        args = xs.val
+    else:
+        return FREE, None
+    return analyzer.call(f, args, scope)
+
+@cost_of(default_costs, 'progn', count_args=False)
+def progn_cost(analyzer, scope, args):
+    return FREE, args[-1] if args else None
+
+@cost_of(default_costs, 'quote')
+def quote_cost(analyzer, scope, val):
+    return FREE, val
+
+@cost_of(default_costs, 'lambda')
+def lambda_cost(analyzer, scope, pars, body):
+    if not isinstance(pars, LispList) or \
+            not all(isinstance(par, LispSymbol) for par in pars.val):
+        return FREE, None
+    pars = [s.val for s in pars.val]
+    clos = ChainMap(*scope.maps)
+    return Estimate(0, 0, 1), LispFunc(pars, body, 'anonymous function', clos)
+
+@cost_of(default_costs, 'set')
+def set_cost(analyzer, scope, name, val):
+    if not isinstance(name, LispSymbol):
+        return FREE, None
+    est, val = analyzer.eval(val, scope)
+    # assignments that may not happen make the variable unknown
+    scope[name.val] = None if analyzer.branching else val
+    # estimates of calls may have depended on the old value
+    analyzer.memo.clear()
+    return est, val
+
+@cost_of(default_costs, 'if')
+def if_cost(analyzer, scope, cond, i, t):
+    est, _ = analyzer.eval(cond, scope)
+    analyzer.branching += 1
+    try:
+        i_est, _ = analyzer.eval(i, scope)
+        t_est, _ = analyzer.eval(t, scope)
+    finally:
+        analyzer.branching -= 1
+    return est.then(i_est.either(t_est)), None
+
+@cost_of(default_costs, 'cons')
+def cons_cost(analyzer, scope, h, t):
+    return Estimate(0, 0, 1), None
+
+@cost_of(default_costs, 'car')
+def car_cost(analyzer, scope, l):
+    return FREE, None
+
+@cost_of(default_costs, 'cdr')
+def cdr_cost(analyzer, scope, l):
+    return Estimate(0, 0, 1), None
+
+@cost_of(default_costs, 'list', count_args=False)
+def list_cost(analyzer, scope, l):
+    return Estimate(0, 0, 1), None
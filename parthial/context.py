@@ -6,6 +6,7 @@ from contextlib import contextmanager
 from collections import ChainMap
 from weakref import WeakSet
 from .errs import LimitationError
+from .analysis import Analyzer, UNBOUNDED
 
 class Environment:
     """A chain of scopes that tracks its elements.
@@ -44,8 +45,10 @@ class Environment:
             new_scopes (list of dict-likes): The new :attr:`scopes` to use.
         """
         old_scopes, self.scopes = self.scopes, new_scopes
-        yield
-        self.scopes = old_scopes
+        try:
+            yield
+        finally:
+            self.scopes = old_scopes
 
     @contextmanager
     def new_scope(self, new_scope={}):
@@ -55,8 +58,10 @@ class Environment:
             new_scope (dict-like): The scope to add.
         """
         old_scopes, self.scopes = self.scopes, self.scopes.new_child(new_scope)
-        yield
-        self.scopes = old_scopes
+        try:
+            yield
+        finally:
+            self.scopes = old_scopes
 
     def new(self, val):
         """Add a new value to me.
@@ -242,6 +247,55 @@ class Context:
         self.depth -= 1
         return res
 
+    def admit(self, expr, unbounded_steps=None, costs=None):
+        """Check that evaluating an expression will stay within my limits,
+        without evaluating it.
+
+        This uses an :class:`~parthial.analysis.Analyzer` to estimate the cost
+        of evaluation. Expressions whose estimated cost exceeds what is left
+        of my limits are rejected. Expressions whose cost cannot be bounded
+        are rejected too, unless ``unbounded_steps`` is given, in which case
+        my :attr:`max_steps` is lowered so that they may take at most that many
+        steps.
+        Analysis itself is limited to as many subexpressions as I have steps
+        left, and expressions that need more are rejected.
+
+        Like :meth:`eval`, this expects its argument to already be an element
+        of my :class:`Environment`.
+
+        Args:
+            expr (LispVal): The expression to check.
+            unbounded_steps (int, optional): The number of steps to allow
+                expressions whose cost cannot be bounded.
+            costs (dict, optional): Cost functions for built-ins, as for
+                :class:`~parthial.analysis.Analyzer`. Calls to built-ins
+                without one are unbounded. For environments using a
+                :class:`~parthial.prelude.Prelude`, use its
+                :meth:`~parthial.prelude.Prelude.costs`.
+
+        Returns:
+            ~parthial.analysis.Estimate: The estimated cost.
+
+        Raises:
+            ~parthial.errs.LimitationError: If the expression is rejected.
+        """
+        analyzer = Analyzer(self.env, costs, self.max_depth - self.depth,
+                            self.max_steps - self.steps)
+        est = analyzer.estimate(expr)
+        over = lambda n, left: n != UNBOUNDED and n > left
+        if over(est.depth, self.max_depth - self.depth):
+            raise LimitationError('too much nesting')
+        if over(est.steps, self.max_steps - self.steps):
+            raise LimitationError('too many steps')
+        if over(est.things, self.env.max_things - len(self.env.things)):
+            raise LimitationError('too many things')
+        if not est.bounded:
+            if unbounded_steps is None:
+                raise LimitationError('unbounded evaluation: ' +
+                                      analyzer.problems[0])
+            self.max_steps = min(self.max_steps, self.steps + unbounded_steps)
+        return est
+
     @classmethod
     def eval_in_new(cls, expr, *args, **kwargs):
         """:meth:`eval` an expression in a new, temporary :class:`Context`.
@@ -0,0 +1,175 @@
+"""
+Prebuilt global scopes containing definitions written in Lisp.
+"""
+
+import io
+import pickle
+from collections import ChainMap
+from functools import partial
+from types import MappingProxyType
+from .vals import LispFunc, LispBuiltin
+from .context import Environment, Context
+from .built_ins import default_globals
+from .analysis import default_costs
+
+def prelude_built_in(name, f):
+    """Wrap a Lisp function as a built-in.
+
+    Built-ins are serialized by name, so values referring to the result will
+    not carry a copy of the function (and its closure) with them.
+
+    Args:
+        name (str): The name of the built-in.
+        f (LispFunc): The function to wrap.
+
+    Returns:
+        LispBuiltin: The wrapped function.
+    """
+    if f.name == 'anonymous function':
+        f = LispFunc(f.pars, f.body, name, f.clos)
+    def call(self, ctx, args):
+        return f(ctx, args)
+    return LispBuiltin(call, name)
+
+class _ImagePickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        if isinstance(obj, LispBuiltin):
+            return obj.name
+        return None
+
+class _ImageUnpickler(pickle.Unpickler):
+    def __init__(self, globals, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.globals = globals
+
+    def persistent_load(self, pid):
+        return self.globals[pid]
+
+def _prelude_cost(f, analyzer, scope, args):
+    return analyzer.call(f, args, scope)
+
+class Prelude:
+    """An immutable global scope extended with definitions written in Lisp.
+
+    Building a :class:`Prelude` evaluates its definitions once; afterwards,
+    any number of :class:`Environments <parthial.context.Environment>` can
+    use it as their global scope without evaluating anything. It can also be
+    :meth:`dumped <dump>` to an image and :meth:`loaded <load>` from it, which
+    is cheaper than building it again.
+
+    Attributes:
+        defs (dict): The definitions, by name. Lisp functions in it close over
+            it, so that they can refer to each other.
+        globals (dict-like): The read-only global scope, containing everything
+            in the base global scope and the definitions. Functions in it are
+            wrapped with :func:`prelude_built_in`, and no longer close over
+            :attr:`defs`; they find other definitions in :attr:`globals`
+            instead, so they only work in environments that use it.
+
+    Args:
+        defs (dict): The definitions.
+        globals (dict-like, optional): The base global scope.
+    """
+
+    def __init__(self, defs, globals=default_globals):
+        self.defs = defs
+        self._costs = {}
+        scope = dict(globals)
+        for k, v in defs.items():
+            if isinstance(v, LispFunc):
+                # closures that my functions return shouldn't carry defs
+                clos = ChainMap(*[m for m in v.clos.maps if m is not defs])
+                f = LispFunc(v.pars, v.body, v.name, clos)
+                v = prelude_built_in(k, f)
+                self._costs[v] = partial(_prelude_cost, f)
+            scope[k] = v
+        self.globals = MappingProxyType(scope)
+
+    @classmethod
+    def build(cls, exprs, globals=default_globals, max_things=5000, **kwargs):
+        """Build a :class:`Prelude` by evaluating some expressions.
+
+        The expressions are evaluated in order in a single, new
+        :class:`~parthial.context.Environment`, and every variable they
+        assign to (e.g., with ``set``) becomes a definition.
+
+        Args:
+            exprs (list of LispVals): The expressions to evaluate.
+            globals (dict-like, optional): The base global scope.
+            max_things (int, optional): The allocation limit for evaluation.
+            **kwargs: Kwargs for the :class:`~parthial.context.Context`
+                constructor.
+
+        Returns:
+            Prelude: The built prelude.
+        """
+        env = Environment(globals, max_things)
+        ctx = Context(env, **kwargs)
+        for expr in exprs:
+            env.rec_new(expr)
+            ctx.eval(expr)
+        return cls(env.scopes.maps[0], globals)
+
+    def dump(self, stream=None):
+        """Serialize my definitions to an image.
+
+        Images are pickles, with built-ins stored by name. Unlike the YAML
+        serialization in :mod:`parthial.serialize`, they are meant to be loaded
+        quickly, and must only be loaded from trusted sources.
+
+        Args:
+            stream (binary file-like, optional): The stream to write to.
+
+        Returns:
+            bytes: The image, if no stream was given.
+        """
+        out = io.BytesIO() if stream is None else stream
+        _ImagePickler(out, pickle.HIGHEST_PROTOCOL).dump(self.defs)
+        if stream is None:
+            return out.getvalue()
+
+    @classmethod
+    def load(cls, stream, globals=default_globals):
+        """Load a :class:`Prelude` from an image made with :meth:`dump`.
+
+        Args:
+            stream (bytes or binary file-like): The image.
+            globals (dict-like, optional): The base global scope. This should
+                be the one that the prelude was built with.
+
+        Returns:
+            Prelude: The loaded prelude.
+        """
+        if isinstance(stream, bytes):
+            stream = io.BytesIO(stream)
+        return cls(_ImageUnpickler(globals, stream).load(), globals)
+
+    def new_env(self, *args, **kwargs):
+        """Get a new :class:`~parthial.context.Environment` using me as its
+        global scope.
+
+        Args:
+            *args: Args for the :class:`~parthial.context.Environment`
+                constructor, after ``globals``.
+            **kwargs: Kwargs for the :class:`~parthial.context.Environment`
+                constructor.
+
+        Returns:
+            Environment: The new environment.
+        """
+        return Environment(self.globals, *args, **kwargs)
+
+    def costs(self, costs=default_costs):
+        """Get cost functions for my functions.
+
+        Pass these to :meth:`~parthial.context.Context.admit` for expressions
+        evaluated in my environments.
+
+        Args:
+            costs (dict, optional): The cost functions to extend.
+
+        Returns:
+            ChainMap: Cost functions for use with
+            :class:`~parthial.analysis.Analyzer`.
+        """
+        return ChainMap(self._costs, costs)
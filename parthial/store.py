@@ -0,0 +1,226 @@
+"""
+Persistent storage for per-tenant interpreter state.
+"""
+
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+import yaml
+from .context import Environment
+from .serialize import ParthialDumper, ParthialLoader
+
+log = logging.getLogger(__name__)
+
+class _Entry:
+    def __init__(self):
+        self.env = self.error = None
+        self.loaded = threading.Event()
+        self.lock = threading.RLock()
+        self.users = 0
+        self.version = 0
+
+    def wait(self):
+        self.loaded.wait()
+        if self.error is not None:
+            raise self.error
+
+class EnvironmentStore:
+    """A database of :class:`Environments <parthial.context.Environment>`,
+    keyed by tenant.
+
+    Environments are kept in an SQLite database, serialized with
+    :class:`~parthial.serialize.ParthialDumper`. Recently used ones are kept
+    deserialized in memory, so that repeated use of the same tenant's
+    :class:`~parthial.context.Environment` does not need to load it again.
+    Changes are not written immediately; instead, a background thread
+    periodically writes every :class:`~parthial.context.Environment` that has
+    been used since it was last written. Call :meth:`close` (or use me as a
+    context manager) to make sure that all changes are written.
+
+    Args:
+        path (str): The path of the database file.
+        globals (dict-like): The global scope for loaded and new
+            :class:`Environments <parthial.context.Environment>`, as used by
+            :class:`~parthial.serialize.ParthialLoader`.
+        max_things (int, optional): The ``max_things`` for new
+            :class:`Environments <parthial.context.Environment>`.
+        max_cached (int, optional): The maximum number of
+            :class:`Environments <parthial.context.Environment>` to keep in
+            memory. This may be exceeded while more sessions are open.
+        delay (float, optional): The number of seconds between writes.
+    """
+
+    def __init__(self, path, globals, max_things=5000, max_cached=128,
+                 delay=1.0):
+        self.globals, self.max_things = globals, max_things
+        self.max_cached, self.delay = max_cached, delay
+        self._cache = OrderedDict()
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS environments '
+                             '(tenant TEXT PRIMARY KEY, data TEXT NOT NULL)')
+        self._closed = False
+        self._closing = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    @contextmanager
+    def session(self, tenant):
+        """Use a tenant's :class:`~parthial.context.Environment` for the
+        duration of the with block.
+
+        If the tenant does not have a stored
+        :class:`~parthial.context.Environment`, a new one is created. Sessions
+        for the same tenant are exclusive, so the yielded
+        :class:`~parthial.context.Environment` must not be used outside of the
+        with block. It will be written at some point after the with block is
+        left, even if it is left by an exception.
+
+        Args:
+            tenant (str): The tenant whose environment to use.
+
+        Yields:
+            Environment: The tenant's environment.
+
+        Raises:
+            ValueError: If I have been closed.
+        """
+        entry = self._acquire(tenant)
+        try:
+            entry.wait()
+            with entry.lock:
+                scopes = entry.env.scopes
+                try:
+                    yield entry.env
+                finally:
+                    entry.env.scopes = scopes
+                    with self._lock:
+                        entry.version += 1
+                        self._dirty[tenant] = entry
+        finally:
+            with self._lock:
+                entry.users -= 1
+                self._evict()
+
+    def flush(self):
+        """Write every changed :class:`~parthial.context.Environment` now.
+
+        Environments that are in use by a session are skipped, and will be
+        written by a later flush. Environments that cannot be serialized are
+        logged and skipped too, without keeping the others from being written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending = list(self._dirty.items())
+            written, rows = [], []
+            for tenant, entry in pending:
+                if not entry.lock.acquire(blocking=False):
+                    continue
+                try:
+                    version = entry.version
+                    data = yaml.dump(entry.env, Dumper=ParthialDumper)
+                except Exception:
+                    log.exception('failed to serialize environment for %r',
+                                  tenant)
+                    continue
+                finally:
+                    entry.lock.release()
+                written.append((tenant, entry, version))
+                rows.append((tenant, data))
+            if not rows:
+                return
+            with self._db_lock, self._db:
+                self._db.executemany('INSERT OR REPLACE INTO environments '
+                                     'VALUES (?, ?)', rows)
+            with self._lock:
+                for tenant, entry, version in written:
+                    if self._dirty.get(tenant) is entry and \
+                            entry.version == version:
+                        del self._dirty[tenant]
+
+    def close(self):
+        """Stop the background writer and write any remaining changes.
+
+        No more sessions may be started afterwards, and none may be open.
+
+        Raises:
+            ValueError: If any sessions are open.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            if any(e.users for e in self._cache.values()):
+                raise ValueError('sessions are still open')
+            self._closed = True
+        self._closing.set()
+        self._writer.join()
+        try:
+            self.flush()
+        finally:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _acquire(self, tenant):
+        load = False
+        with self._lock:
+            if self._closed:
+                raise ValueError('store is closed')
+            entry = self._cache.get(tenant)
+            if entry is not None:
+                self._cache.move_to_end(tenant)
+            else:
+                # an evicted environment may still be waiting to be written
+                entry = self._dirty.get(tenant)
+                if entry is None:
+                    entry, load = _Entry(), True
+                self._cache[tenant] = entry
+            entry.users += 1
+            self._evict()
+        if load:
+            # other sessions for this tenant wait for the entry to be loaded
+            try:
+                entry.env = self._load(tenant)
+            except Exception as e:
+                entry.error = e
+                with self._lock:
+                    if self._cache.get(tenant) is entry:
+                        del self._cache[tenant]
+            finally:
+                entry.loaded.set()
+        return entry
+
+    def _evict(self):
+        excess = len(self._cache) - self.max_cached
+        if excess > 0:
+            idle = [t for t, e in self._cache.items() if not e.users]
+            for tenant in idle[:excess]:
+                del self._cache[tenant]
+
+    def _load(self, tenant):
+        with self._db_lock:
+            row = self._db.execute('SELECT data FROM environments '
+                                   'WHERE tenant = ?', (tenant,)).fetchone()
+        if row is None:
+            return Environment(self.globals, self.max_things)
+        loader = partial(ParthialLoader, self.globals)
+        return yaml.load(row[0], Loader=loader)
+
+    def _write_loop(self):
+        while not self._closing.wait(self.delay):
+            try:
+                self.flush()
+            except Exception:
+                # unwritten environments stay dirty, so they'll be retried
+                log.exception('failed to write environments')
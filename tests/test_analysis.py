@@ -0,0 +1,107 @@
+import pytest
+from parthial.analysis import default_costs
+from parthial.built_ins import default_globals
+from parthial.context import Context, Environment
+from parthial.errs import LimitationError
+from parthial.prelude import Prelude
+from parthial.vals import LispSymbol, LispList
+
+def sexp(*xs):
+    return LispList([LispSymbol(x) if isinstance(x, str) else x for x in xs])
+
+def test_chain_of_calls_is_analyzed_once_per_function():
+    env = Environment(default_globals)
+    defs = [sexp('set', 'f0', sexp('lambda', sexp('x'), 'x'))]
+    for i in range(1, 20):
+        prev = 'f{}'.format(i - 1)
+        body = sexp('if', 'x', sexp(prev, 'x'),
+                    sexp(prev, sexp('quote', sexp())))
+        defs.append(sexp('set', 'f{}'.format(i),
+                         sexp('lambda', sexp('x'), body)))
+    for expr in defs:
+        Context.eval_in_new(expr, env)
+    call = env.rec_new(sexp('f19', sexp('quote', 'a')))
+    ctx = Context(env, max_steps=1000)
+    est = ctx.admit(call)
+    ctx.eval(call)
+    assert ctx.steps <= est.steps <= 1000
+
+def test_prelude_functions_are_estimated():
+    second = sexp('lambda', sexp('xs'), sexp('car', sexp('cdr', 'xs')))
+    image = Prelude.build([sexp('set', 'second', second)]).dump()
+    prelude = Prelude.load(image)
+    env = prelude.new_env()
+    call = env.rec_new(sexp('second', sexp('quote', sexp('a', 'b'))))
+    assert Context(env).admit(call, costs=prelude.costs()).bounded
+
+def test_preludes_leave_default_costs_alone():
+    before = dict(default_costs)
+    Prelude.build([sexp('set', 'f', sexp('lambda', sexp(), sexp('list')))])
+    assert default_costs == before
+
+def quote(x):
+    return sexp('quote', x)
+
+def admit(expr, max_things=5000, **kwargs):
+    env = Environment(default_globals, max_things)
+    ctx = Context(env, **kwargs)
+    ctx.admit(env.rec_new(expr))
+    return ctx
+
+RECURSIVE_FUNC = sexp('progn',
+    sexp('set', 'f', sexp('lambda', sexp('x'), sexp('f', 'x'))),
+    sexp('f', quote('a')))
+RECURSIVE_EVAL = sexp('progn',
+    sexp('set', 'q', quote(sexp('eval', 'q'))),
+    sexp('eval', 'q'))
+RECURSIVE_APPLY = sexp('progn',
+    sexp('set', 'f', sexp('lambda', sexp('x'),
+                          sexp('apply', 'f', sexp('list', 'x')))),
+    sexp('f', quote('a')))
+
+@pytest.mark.parametrize('expr', [RECURSIVE_FUNC, RECURSIVE_EVAL,
+                                  RECURSIVE_APPLY])
+def test_recursion_is_rejected(expr):
+    with pytest.raises(LimitationError) as e:
+        admit(expr)
+    assert e.value.val.startswith('unbounded evaluation: recursive')
+
+def test_unbounded_steps_lowers_max_steps():
+    env = Environment(default_globals)
+    ctx = Context(env)
+    ctx.admit(env.rec_new(RECURSIVE_FUNC), unbounded_steps=50)
+    assert ctx.max_steps == 50
+    with pytest.raises(LimitationError):
+        ctx.eval(RECURSIVE_FUNC)
+    assert ctx.steps == 50
+
+CONS = sexp('cons', quote('a'), sexp('list', quote('b')))
+
+def test_estimate_bounds_evaluation():
+    ctx = admit(CONS)
+    things = len(ctx.env.things)
+    est = ctx.admit(CONS)
+    ctx.eval(CONS)
+    assert ctx.steps <= est.steps
+    assert len(ctx.env.things) - things <= est.things
+
+def test_too_many_steps_is_rejected():
+    # repeated calls are estimated once, so analysis stays within the steps
+    f = sexp('lambda', sexp(), sexp('list', quote('a'), quote('b')))
+    expr = sexp('progn', sexp('set', 'f', f), *[sexp('f')] * 10)
+    est = admit(expr).admit(expr)
+    with pytest.raises(LimitationError) as e:
+        admit(expr, max_steps=est.steps - 1)
+    assert e.value.val == 'too many steps'
+
+def test_too_much_nesting_is_rejected():
+    with pytest.raises(LimitationError) as e:
+        admit(CONS, max_depth=3)
+    assert e.value.val == 'too much nesting'
+
+def test_too_many_things_is_rejected():
+    env = Environment(default_globals)
+    env.rec_new(CONS)
+    with pytest.raises(LimitationError) as e:
+        admit(CONS, max_things=len(env.things) + 1)
+    assert e.value.val == 'too many things'
@@ -0,0 +1,57 @@
+from functools import partial
+import yaml
+from parthial.context import Context
+from parthial.prelude import Prelude
+from parthial.serialize import ParthialDumper, ParthialLoader
+from parthial.vals import LispSymbol, LispList
+
+def sexp(*xs):
+    return LispList([LispSymbol(x) if isinstance(x, str) else x for x in xs])
+
+def quote(x):
+    return sexp('quote', x)
+
+MAP = sexp('set', 'map', sexp('lambda', sexp('f', 'xs'),
+    sexp('if', 'xs',
+         sexp('cons', sexp('f', sexp('car', 'xs')),
+                      sexp('map', 'f', sexp('cdr', 'xs'))),
+         quote(sexp()))))
+K = sexp('set', 'k', sexp('lambda', sexp('x'), sexp('lambda', sexp('y'), 'x')))
+
+def build():
+    return Prelude.build([MAP, K])
+
+def run(env, expr):
+    return Context.eval_in_new(expr, env)
+
+def test_round_trip():
+    prelude = Prelude.load(build().dump())
+    assert sorted(prelude.defs) == ['k', 'map']
+    assert prelude.defs['map'].clos.maps[0] is prelude.defs
+
+def test_call_from_new_env():
+    env = Prelude.load(build().dump()).new_env()
+    res = run(env, sexp('map', 'car', quote(sexp(sexp('a'), sexp('b')))))
+    assert str(res) == "('a' 'b')"
+
+def test_reference_is_serialized_by_name():
+    prelude = build()
+    env = prelude.new_env()
+    run(env, sexp('set', 'm', 'map'))
+    data = yaml.dump(env, Dumper=ParthialDumper)
+    assert "!lispbuiltin;1 'map'" in data
+    env = yaml.load(data, Loader=partial(ParthialLoader, prelude.globals))
+    assert env['m'] is prelude.globals['map']
+
+def test_returned_closure_does_not_carry_defs():
+    prelude = build()
+    env = prelude.new_env()
+    run(env, sexp('set', 'h', sexp('k', quote('a'))))
+    assert run(env, sexp('h', quote('b'))).val == 'a'
+    data = yaml.dump(env, Dumper=ParthialDumper)
+    assert "'map'" not in data and "'k'" not in data
+
+def test_definitions_keep_their_names():
+    prelude = build()
+    assert prelude.defs['map'].name == 'anonymous function'
+    assert str(prelude.globals['map']) == 'map'
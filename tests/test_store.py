@@ -0,0 +1,130 @@
+import sqlite3
+import threading
+import time
+import pytest
+from parthial.built_ins import default_globals
+from parthial.context import Context
+from parthial.errs import LispError
+from parthial.store import EnvironmentStore
+from parthial.vals import LispSymbol, LispList
+
+def sexp(*xs):
+    return LispList([LispSymbol(x) if isinstance(x, str) else x for x in xs])
+
+def run(env, expr):
+    return Context.eval_in_new(expr, env)
+
+def test_failed_command_keeps_scopes(tmp_path):
+    path = str(tmp_path / 'envs.db')
+    with EnvironmentStore(path, default_globals) as store:
+        with store.session('alice') as env:
+            run(env, sexp('set', 'f', sexp('lambda', sexp('x'),
+                                           sexp('car', 'x'))))
+        with pytest.raises(LispError):
+            with store.session('alice') as env:
+                run(env, sexp('f', sexp('list')))
+        with store.session('alice') as env:
+            assert list(env.scopes.maps[0]) == ['f']
+            run(env, sexp('set', 'y', sexp('quote', 'y')))
+    with EnvironmentStore(path, default_globals) as store:
+        with store.session('alice') as env:
+            assert len(env.scopes.maps) == 1
+            assert sorted(env.scopes.maps[0]) == ['f', 'y']
+
+def test_session_after_close(tmp_path):
+    store = EnvironmentStore(str(tmp_path / 'envs.db'), default_globals)
+    store.close()
+    with pytest.raises(ValueError):
+        with store.session('alice'):
+            pass
+
+def test_unserializable_environment_does_not_block_others(tmp_path):
+    path = str(tmp_path / 'envs.db')
+    with EnvironmentStore(path, default_globals) as store:
+        with store.session('mallory') as env:
+            run(env, sexp('set', 'x', sexp('list')))
+            for _ in range(400):
+                run(env, sexp('set', 'x', sexp('list', 'x')))
+        with store.session('bob') as env:
+            run(env, sexp('set', 'y', sexp('quote', 'y')))
+    with EnvironmentStore(path, default_globals) as store:
+        with store.session('bob') as env:
+            assert 'y' in env
+
+def test_close_with_open_session(tmp_path):
+    store = EnvironmentStore(str(tmp_path / 'envs.db'), default_globals)
+    with store.session('alice'):
+        with pytest.raises(ValueError):
+            store.close()
+    store.close()
+
+def count_loads(store):
+    loads = []
+    load = store._load
+    def counted(tenant):
+        loads.append(tenant)
+        return load(tenant)
+    store._load = counted
+    return loads
+
+def test_least_recently_used_is_evicted(tmp_path):
+    path = str(tmp_path / 'envs.db')
+    with EnvironmentStore(path, default_globals, max_cached=2) as store:
+        loads = count_loads(store)
+        for tenant in ['a', 'b', 'a', 'c', 'a', 'b']:
+            with store.session(tenant):
+                pass
+            store.flush()
+        assert loads == ['a', 'b', 'c', 'b']
+
+def test_evicted_dirty_environment_is_reused(tmp_path):
+    path = str(tmp_path / 'envs.db')
+    with EnvironmentStore(path, default_globals, max_cached=1,
+                          delay=60) as store:
+        loads = count_loads(store)
+        with store.session('a') as env:
+            run(env, sexp('set', 'x', sexp('quote', 'x')))
+            first = env
+        with store.session('b'):
+            pass
+        with store.session('a') as env:
+            assert env is first
+            assert 'x' in env
+        assert loads == ['a', 'b']
+
+def test_background_writer_persists(tmp_path):
+    path = str(tmp_path / 'envs.db')
+    with EnvironmentStore(path, default_globals, delay=0.01) as store:
+        with store.session('a') as env:
+            run(env, sexp('set', 'x', sexp('quote', 'x')))
+        db = sqlite3.connect(path)
+        for _ in range(200):
+            row = db.execute('SELECT data FROM environments').fetchone()
+            if row:
+                break
+            time.sleep(0.01)
+        db.close()
+        assert row and "'x'" in row[0]
+
+def test_concurrent_sessions_load_once(tmp_path):
+    path = str(tmp_path / 'envs.db')
+    with EnvironmentStore(path, default_globals) as store:
+        loads = count_loads(store)
+        load, release = store._load, threading.Event()
+        def slow(tenant):
+            release.wait()
+            return load(tenant)
+        store._load = slow
+        envs = []
+        def use():
+            with store.session('a') as env:
+                envs.append(env)
+        threads = [threading.Thread(target=use) for _ in range(3)]
+        for t in threads:
+            t.start()
+        time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join()
+        assert loads == ['a']
+        assert len(envs) == 3 and all(env is envs[0] for env in envs)